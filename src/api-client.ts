@@ -2,11 +2,17 @@
  * xAI Grok API クライアント（X検索用）
  */
 
+const FULLWIDTH_AT = "\uff20";
+
 /** カンマ区切りのXハンドル文字列をリストに変換する。@/＠プレフィックスを除去。 */
 export function parseHandles(rawValue: string): string[] {
   if (!rawValue) return [];
+  // 全角＠を含まない通常の入力では置換による文字列生成を省く
+  const normalized = rawValue.includes(FULLWIDTH_AT)
+    ? rawValue.replaceAll(FULLWIDTH_AT, "@")
+    : rawValue;
   const handles: string[] = [];
-  for (const part of rawValue.replace(/\uff20/g, "@").split(",")) {
+  for (const part of normalized.split(",")) {
     let handle = part.trim();
     if (!handle) continue;
     if (handle.startsWith("@")) handle = handle.slice(1);
@@ -15,25 +21,85 @@ export function parseHandles(rawValue: string): string[] {
   return handles;
 }
 
+// YYYY-MM-DD または YYYY-MM-DDTHH:MM[:SS[.fff]][Z|±HH:MM] の形だけを通す
+const ISO_DATE_PATTERN =
+  /^\d{4}-\d{2}-\d{2}(?:T\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:\d{2})?)?$/;
+
+// YYYY-MM-DD のうち数字が入る位置
+const ISO_DATE_DIGIT_INDEXES = [0, 1, 2, 3, 5, 6, 8, 9] as const;
+
+/** 10文字の YYYY-MM-DD が Date で受理される形か（月 01-12、日 01-31）を文字単位で判定する。 */
+function isPlainIsoDate(value: string): boolean {
+  if (value.length !== 10) return false;
+  if (value.charCodeAt(4) !== 0x2d || value.charCodeAt(7) !== 0x2d) return false;
+  for (const i of ISO_DATE_DIGIT_INDEXES) {
+    const c = value.charCodeAt(i);
+    if (c < 0x30 || c > 0x39) return false;
+  }
+  const month = Number(value.slice(5, 7));
+  const day = Number(value.slice(8, 10));
+  return month >= 1 && month <= 12 && day >= 1 && day <= 31;
+}
+
 /** YYYY-MM-DD形式の日付文字列を検証する。空文字はnullを返す。 */
 export function validateIsoDate(value: string, label: string): string | null {
   if (!value) return null;
-  if (!/^\d{4}-\d{2}-\d{2}/.test(value) || isNaN(new Date(value).getTime())) {
+  // 大半は素の YYYY-MM-DD なので Date の生成を省略する
+  if (isPlainIsoDate(value)) return value;
+  // 形が合わない入力は Date を生成せずに弾き、形が合うものだけ暦として検証する
+  if (!ISO_DATE_PATTERN.test(value) || isNaN(new Date(value).getTime())) {
     throw new Error(`${label}はYYYY-MM-DD形式で指定してください: ${value}`);
   }
   return value;
 }
 
-/** Grok API レスポンスからテキストを抽出する。 */
+export interface CommonSearchParams {
+  fromDate: string | null;
+  toDate: string | null;
+  freshness: string;
+  maxResults: number;
+}
+
+/** 各ツール共通の日付検証・鮮度の正規化・件数の丸め込みを行う。日付が不正ならErrorを投げる。 */
+export function prepareCommonParams(
+  fromDate: string,
+  toDate: string,
+  freshness: string,
+  maxResults: number,
+  defaultFreshness: string
+): CommonSearchParams {
+  return {
+    fromDate: validateIsoDate(fromDate, "from_date"),
+    toDate: validateIsoDate(toDate, "to_date"),
+    freshness: freshness?.toLowerCase() || defaultFreshness,
+    maxResults: Math.min(25, Math.max(1, maxResults)),
+  };
+}
+
+/** message.content の1ブロックからテキストを取り出す。対象外のブロックは undefined。 */
+function contentBlockText(block: unknown): string | undefined {
+  if (typeof block === "string") return block;
+  if (typeof block !== "object" || block === null) return undefined;
+  const b = block as Record<string, unknown>;
+  if (b.type !== "output_text" && b.type !== "text") return undefined;
+  if (typeof b.text === "string" && b.text) return b.text;
+  if (typeof b.output_text === "string") return b.output_text;
+  return undefined;
+}
+
+/** Grok API レスポンスからテキストを抽出する。抽出できない場合はJSON全体を返すため空文字にはならない。 */
 export function extractTextFromResponse(payload: Record<string, unknown>): string {
   // 最優先: トップレベル output_text
+  let text = "";
   const outputText = payload.output_text;
-  if (outputText) {
-    if (Array.isArray(outputText)) {
-      return outputText.map(String).join("\n").trim();
-    }
-    return String(outputText).trim();
+  if (typeof outputText === "string") {
+    text = outputText.trim();
+  } else if (Array.isArray(outputText)) {
+    text = outputText.map(String).join("\n").trim();
+  } else if (outputText) {
+    text = String(outputText).trim();
   }
+  if (text) return text;
 
   // output 配列からメッセージを抽出
   let outputs = payload.output;
@@ -57,19 +123,12 @@ export function extractTextFromResponse(payload: Record<string, unknown>): strin
     if (!Array.isArray(content)) continue;
 
     for (const block of content) {
-      if (typeof block === "string") {
-        if (block) texts.push(block);
-        continue;
-      }
-      if (typeof block !== "object" || block === null) continue;
-      const b = block as Record<string, unknown>;
-      if (b.type === "output_text" || b.type === "text") {
-        const textValue = (b.text || b.output_text) as string | undefined;
-        if (textValue) texts.push(String(textValue));
-      }
+      const blockText = contentBlockText(block);
+      if (blockText) texts.push(blockText);
     }
   }
-  if (texts.length > 0) return texts.join("\n").trim();
+  text = texts.join("\n").trim();
+  if (text) return text;
 
   // フォールバック: JSON全体
   return JSON.stringify(payload);
@@ -93,61 +152,49 @@ export interface SearchOptions {
   timeoutSeconds?: number;
 }
 
+export const MISSING_API_KEY_MESSAGE =
+  "XAI_API_KEY (またはGROK_API_KEY) が設定されていません。";
+
 export class XSearchAPIClient {
-  private apiKey: string;
-  private apiBase: string;
-  private model: string;
+  private readonly apiKey: string;
+  private readonly apiBase: string;
+  private readonly model: string;
+  private readonly headers: Record<string, string>;
+  private readonly responsesUrl: string;
 
   constructor() {
     this.apiKey = process.env.XAI_API_KEY || process.env.GROK_API_KEY || "";
     this.apiBase = process.env.XAI_API_BASE || "https://api.x.ai/v1";
     this.model = process.env.XAI_GROK_MODEL || "grok-4-0709";
+    // リクエストごとに変わらない値は生成時に一度だけ組み立てる
+    this.headers = {
+      Authorization: `Bearer ${this.apiKey}`,
+      "Content-Type": "application/json",
+    };
+    this.responsesUrl = `${this.apiBase.replace(/\/+$/, "")}/responses`;
+  }
+
+  /** APIキーが設定されているか。未設定ならツール側で検証前に打ち切れる。 */
+  get hasApiKey(): boolean {
+    return this.apiKey !== "";
   }
 
   async search(options: SearchOptions): Promise<string> {
     if (!this.apiKey) {
-      return "XAI_API_KEY (またはGROK_API_KEY) が設定されていません。";
+      return MISSING_API_KEY_MESSAGE;
     }
 
-    const toolConfig: Record<string, unknown> = {
-      max_results: options.maxResults ?? 8,
-      search_mode: options.searchMode ?? "auto",
-      freshness: options.freshness ?? "auto",
-      language: options.language ?? "ja",
-    };
-    if (options.allowedHandles?.length)
-      toolConfig.allowed_x_handles = options.allowedHandles;
-    if (options.excludedHandles?.length)
-      toolConfig.excluded_x_handles = options.excludedHandles;
-    if (options.fromDate) toolConfig.from_date = options.fromDate;
-    if (options.toDate) toolConfig.to_date = options.toDate;
-    if (options.enableImageUnderstanding)
-      toolConfig.enable_image_understanding = true;
-    if (options.enableVideoUnderstanding)
-      toolConfig.enable_video_understanding = true;
-
-    const payload = {
-      model: this.model,
-      input: [
-        { role: "system", content: options.systemPrompt },
-        { role: "user", content: options.query.trim() },
-      ],
-      tools: [{ type: "x_search", x_search: toolConfig }],
-      temperature: options.temperature ?? 0.2,
-      max_output_tokens: options.maxOutputTokens ?? 900,
-    };
-
-    const url = `${this.apiBase.replace(/\/+$/, "")}/responses`;
+    const payload = this.buildPayload(options);
     const timeoutMs = (options.timeoutSeconds ?? 45) * 1000;
 
+    // Node の fetch (undici) はグローバルな接続プールで接続を使い回すが、
+    // アイドル接続は既定の keepAliveTimeout (4秒) で閉じられる。
+    // 呼び出し間隔がそれより空くと TCP/TLS ハンドシェイクからやり直しになる
     let response: Response;
     try {
-      response = await fetch(url, {
+      response = await fetch(this.responsesUrl, {
         method: "POST",
-        headers: {
-          Authorization: `Bearer ${this.apiKey}`,
-          "Content-Type": "application/json",
-        },
+        headers: this.headers,
         body: JSON.stringify(payload),
         signal: AbortSignal.timeout(timeoutMs),
       });
@@ -159,6 +206,10 @@ export class XSearchAPIClient {
     const rawBody = await response.text();
 
     if (response.status >= 300) {
+      // ゲートウェイのHTML等、JSONでない本文は例外を経ずにそのまま返す
+      if (!rawBody.trimStart().startsWith("{")) {
+        return `Grok APIエラー(${response.status}): ${rawBody}`;
+      }
       try {
         const errorPayload = JSON.parse(rawBody);
         const err = errorPayload.error;
@@ -183,7 +234,37 @@ export class XSearchAPIClient {
       return `Grok APIの応答を解析できませんでした: ${rawBody}`;
     }
 
-    const text = extractTextFromResponse(responsePayload);
-    return text || JSON.stringify(responsePayload);
+    return extractTextFromResponse(responsePayload);
+  }
+
+  /** Responses API へ送るリクエストボディを組み立てる。 */
+  private buildPayload(options: SearchOptions): Record<string, unknown> {
+    const toolConfig: Record<string, unknown> = {
+      max_results: options.maxResults ?? 8,
+      search_mode: options.searchMode ?? "auto",
+      freshness: options.freshness ?? "auto",
+      language: options.language ?? "ja",
+    };
+    if (options.allowedHandles?.length)
+      toolConfig.allowed_x_handles = options.allowedHandles;
+    if (options.excludedHandles?.length)
+      toolConfig.excluded_x_handles = options.excludedHandles;
+    if (options.fromDate) toolConfig.from_date = options.fromDate;
+    if (options.toDate) toolConfig.to_date = options.toDate;
+    if (options.enableImageUnderstanding)
+      toolConfig.enable_image_understanding = true;
+    if (options.enableVideoUnderstanding)
+      toolConfig.enable_video_understanding = true;
+
+    return {
+      model: this.model,
+      input: [
+        { role: "system", content: options.systemPrompt },
+        { role: "user", content: options.query.trim() },
+      ],
+      tools: [{ type: "x_search", x_search: toolConfig }],
+      temperature: options.temperature ?? 0.2,
+      max_output_tokens: options.maxOutputTokens ?? 900,
+    };
   }
 }
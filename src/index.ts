@@ -2,17 +2,20 @@
 
 import { McpServer } from "@modelcontextprotocol/sdk/server/mcp.js";
 import { StdioServerTransport } from "@modelcontextprotocol/sdk/server/stdio.js";
+import { XSearchAPIClient } from "./api-client.js";
 import { registerSearchTools, registerAnalysisTools } from "./tools.js";
 
-const server = new McpServer({
-  name: "x_search",
-  version: "0.1.0",
-});
+async function main() {
+  // クライアントは起動時にここで生成して渡し、tools.ts の読み込み時には何も生成しない
+  const server = new McpServer({
+    name: "x_search",
+    version: "0.1.0",
+  });
+  const apiClient = new XSearchAPIClient();
 
-registerSearchTools(server);
-registerAnalysisTools(server);
+  registerSearchTools(server, apiClient);
+  registerAnalysisTools(server, apiClient);
 
-async function main() {
   const transport = new StdioServerTransport();
   await server.connect(transport);
   console.error("X Search MCP サーバー起動完了");
@@ -5,9 +5,11 @@
 import { z } from "zod";
 import type { McpServer } from "@modelcontextprotocol/sdk/server/mcp.js";
 import {
-  XSearchAPIClient,
+  MISSING_API_KEY_MESSAGE,
+  type XSearchAPIClient,
   parseHandles,
-  validateIsoDate,
+  prepareCommonParams,
+  type CommonSearchParams,
 } from "./api-client.js";
 
 const SEARCH_SYSTEM_PROMPT =
@@ -24,35 +26,42 @@ const USER_SEARCH_SYSTEM_PROMPT =
   "2. 投稿の傾向やトピックを簡潔に説明する\n" +
   "3. 投稿日時がわかる場合は記載する";
 
-const ANALYSIS_PROMPTS: Record<string, string> = {
-  summary:
+const ANALYSIS_PROMPTS: ReadonlyMap<string, string> = new Map([
+  [
+    "summary",
     "あなたはSNS分析の専門家です。" +
-    "指定されたトピックについてXの投稿を調査し、以下の形式で分析結果を報告してください:\n" +
-    "1. **概要**: トピックに関する全体的な状況（2-3文）\n" +
-    "2. **主要な意見・情報**: 重要な投稿を箇条書きで5-8件（ポストURLを付記）\n" +
-    "3. **まとめ**: 全体的な傾向や注目点",
-  sentiment:
+      "指定されたトピックについてXの投稿を調査し、以下の形式で分析結果を報告してください:\n" +
+      "1. **概要**: トピックに関する全体的な状況（2-3文）\n" +
+      "2. **主要な意見・情報**: 重要な投稿を箇条書きで5-8件（ポストURLを付記）\n" +
+      "3. **まとめ**: 全体的な傾向や注目点",
+  ],
+  [
+    "sentiment",
     "あなたはSNS感情分析の専門家です。" +
-    "指定されたトピックについてXの投稿を調査し、以下の形式で感情分析を報告してください:\n" +
-    "1. **全体的な感情傾向**: ポジティブ/ネガティブ/中立の割合感\n" +
-    "2. **肯定的な意見**: 代表的な投稿を3-5件（ポストURLを付記）\n" +
-    "3. **否定的な意見**: 代表的な投稿を3-5件（ポストURLを付記）\n" +
-    "4. **総評**: 賛否のバランスと主な論点",
-  timeline:
+      "指定されたトピックについてXの投稿を調査し、以下の形式で感情分析を報告してください:\n" +
+      "1. **全体的な感情傾向**: ポジティブ/ネガティブ/中立の割合感\n" +
+      "2. **肯定的な意見**: 代表的な投稿を3-5件（ポストURLを付記）\n" +
+      "3. **否定的な意見**: 代表的な投稿を3-5件（ポストURLを付記）\n" +
+      "4. **総評**: 賛否のバランスと主な論点",
+  ],
+  [
+    "timeline",
     "あなたはニュースタイムライン作成の専門家です。" +
-    "指定されたトピックについてXの投稿を時系列で調査し、以下の形式で報告してください:\n" +
-    "1. 時系列順に主要な投稿・出来事を列挙する（日時とポストURLを付記）\n" +
-    "2. 各イベント間の関連性や因果関係を説明する\n" +
-    "3. 最新の状況をまとめる",
-};
-
-const apiClient = new XSearchAPIClient();
+      "指定されたトピックについてXの投稿を時系列で調査し、以下の形式で報告してください:\n" +
+      "1. 時系列順に主要な投稿・出来事を列挙する（日時とポストURLを付記）\n" +
+      "2. 各イベント間の関連性や因果関係を説明する\n" +
+      "3. 最新の状況をまとめる",
+  ],
+]);
 
 function textResult(text: string) {
   return { content: [{ type: "text" as const, text }] };
 }
 
-export function registerSearchTools(server: McpServer): void {
+export function registerSearchTools(
+  server: McpServer,
+  apiClient: XSearchAPIClient
+): void {
   server.tool(
     "search_posts",
     "X(旧Twitter)の投稿を検索します。Grok x_search経由で最新ポストを取得します。",
@@ -96,8 +105,10 @@ export function registerSearchTools(server: McpServer): void {
       if (!params.query?.trim()) {
         return textResult("検索クエリを指定してください。");
       }
+      if (!apiClient.hasApiKey) {
+        return textResult(MISSING_API_KEY_MESSAGE);
+      }
 
-      const maxResults = Math.max(1, Math.min(25, params.max_results));
       const temperature = Math.max(0.0, Math.min(1.0, params.temperature));
 
       const allowed = parseHandles(params.allowed_x_handles);
@@ -108,9 +119,15 @@ export function registerSearchTools(server: McpServer): void {
         );
       }
 
+      let common: CommonSearchParams;
       try {
-        validateIsoDate(params.from_date, "from_date");
-        validateIsoDate(params.to_date, "to_date");
+        common = prepareCommonParams(
+          params.from_date,
+          params.to_date,
+          params.freshness,
+          params.max_results,
+          "auto"
+        );
       } catch (e) {
         return textResult(e instanceof Error ? e.message : String(e));
       }
@@ -118,12 +135,9 @@ export function registerSearchTools(server: McpServer): void {
       const result = await apiClient.search({
         query: params.query,
         systemPrompt: SEARCH_SYSTEM_PROMPT,
-        maxResults,
+        ...common,
         allowedHandles: allowed.length > 0 ? allowed : null,
         excludedHandles: excluded.length > 0 ? excluded : null,
-        fromDate: params.from_date || null,
-        toDate: params.to_date || null,
-        freshness: params.freshness?.toLowerCase() || "auto",
         searchMode: params.search_mode?.toLowerCase() || "auto",
         language: params.language,
         enableImageUnderstanding: params.enable_image_understanding,
@@ -162,6 +176,9 @@ export function registerSearchTools(server: McpServer): void {
       if (!params.username?.trim()) {
         return textResult("ユーザー名を指定してください。");
       }
+      if (!apiClient.hasApiKey) {
+        return textResult(MISSING_API_KEY_MESSAGE);
+      }
 
       const handle = params.username.trim().replace(/^@/, "");
       let searchQuery = `@${handle}の投稿`;
@@ -169,11 +186,15 @@ export function registerSearchTools(server: McpServer): void {
         searchQuery = `@${handle} ${params.query.trim()}`;
       }
 
-      const maxResults = Math.max(1, Math.min(25, params.max_results));
-
+      let common: CommonSearchParams;
       try {
-        validateIsoDate(params.from_date, "from_date");
-        validateIsoDate(params.to_date, "to_date");
+        common = prepareCommonParams(
+          params.from_date,
+          params.to_date,
+          params.freshness,
+          params.max_results,
+          "auto"
+        );
       } catch (e) {
         return textResult(e instanceof Error ? e.message : String(e));
       }
@@ -181,11 +202,8 @@ export function registerSearchTools(server: McpServer): void {
       const result = await apiClient.search({
         query: searchQuery,
         systemPrompt: USER_SEARCH_SYSTEM_PROMPT,
-        maxResults,
+        ...common,
         allowedHandles: [handle],
-        fromDate: params.from_date || null,
-        toDate: params.to_date || null,
-        freshness: params.freshness?.toLowerCase() || "auto",
         searchMode: params.search_mode?.toLowerCase() || "latest",
         language: params.language,
         maxOutputTokens: params.max_output_tokens,
@@ -196,7 +214,10 @@ export function registerSearchTools(server: McpServer): void {
   );
 }
 
-export function registerAnalysisTools(server: McpServer): void {
+export function registerAnalysisTools(
+  server: McpServer,
+  apiClient: XSearchAPIClient
+): void {
   server.tool(
     "analyze_topic",
     "X上でのトピックに対する反応・議論を分析します。",
@@ -225,20 +246,27 @@ export function registerAnalysisTools(server: McpServer): void {
       if (!params.topic?.trim()) {
         return textResult("分析対象のトピックを指定してください。");
       }
+      if (!apiClient.hasApiKey) {
+        return textResult(MISSING_API_KEY_MESSAGE);
+      }
 
       const aspect = params.aspect?.toLowerCase() || "summary";
-      const systemPrompt = ANALYSIS_PROMPTS[aspect];
-      if (!systemPrompt) {
+      const systemPrompt = ANALYSIS_PROMPTS.get(aspect);
+      if (systemPrompt === undefined) {
         return textResult(
           `aspectは summary/sentiment/timeline のいずれかを指定してください（指定値: ${params.aspect}）`
         );
       }
 
-      const maxResults = Math.max(1, Math.min(25, params.max_results));
-
+      let common: CommonSearchParams;
       try {
-        validateIsoDate(params.from_date, "from_date");
-        validateIsoDate(params.to_date, "to_date");
+        common = prepareCommonParams(
+          params.from_date,
+          params.to_date,
+          params.freshness,
+          params.max_results,
+          "week"
+        );
       } catch (e) {
         return textResult(e instanceof Error ? e.message : String(e));
       }
@@ -246,10 +274,7 @@ export function registerAnalysisTools(server: McpServer): void {
       const result = await apiClient.search({
         query: params.topic.trim(),
         systemPrompt,
-        maxResults,
-        fromDate: params.from_date || null,
-        toDate: params.to_date || null,
-        freshness: params.freshness?.toLowerCase() || "week",
+        ...common,
         searchMode: "auto",
         language: params.language,
         temperature: 0.3,